@@ -1,5 +1,7 @@
 import os
-import time
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 from atproto import Client, models
 from dotenv import load_dotenv
@@ -16,67 +18,114 @@ load_dotenv()
 BSKY_USERNAME = os.getenv("BSKY_USERNAME")
 BSKY_PASSWORD = os.getenv("BSKY_PASSWORD")
 
-def get_all_replies(client: Client, actor_did: str) -> list:
+async def _fetch_reply_window(client: Client, actor_did: str, since: datetime, until: datetime,
+                             semaphore: asyncio.Semaphore) -> list:
     """
-    Fetches all replies made by a specific actor (user DID).
+    Fetches the replies made by an actor within [since, until), following the cursor inside the window.
     """
-    all_replies = []
+    replies = []
     cursor = None
-    while True:
-        try:
-            response = client.app.bsky.feed.search_posts(
-                q=f"from:{actor_did} reply",
-                cursor=cursor,
-                limit=100  # Max limit per request
-            )
-            posts = response.posts
-            if not posts:
+    async with semaphore:
+        while True:
+            try:
+                # The atproto Client is synchronous, so each request runs in a worker thread
+                response = await asyncio.to_thread(
+                    client.app.bsky.feed.search_posts,
+                    params={
+                        'q': f"from:{actor_did} reply",
+                        'since': since.isoformat(),
+                        'until': until.isoformat(),
+                        'cursor': cursor,
+                        'limit': 100  # Max limit per request
+                    }
+                )
+                posts = response.posts
+                if not posts:
+                    break
+                replies.extend(posts)
+                cursor = response.cursor
+                if not cursor:
+                    break
+                await asyncio.sleep(0.5)  # Be kind to the API
+            except Exception as e:
+                logging.error(f"Error fetching replies for {actor_did} between {since:%Y-%m-%d} and {until:%Y-%m-%d}: {e}")
                 break
-            all_replies.extend(posts)
-            cursor = response.cursor
-            if not cursor:
-                break
-            time.sleep(0.5)  # Be kind to the API
-        except Exception as e:
-            logging.error(f"Error fetching replies for {actor_did}: {e}")
-            break
-    return all_replies
+    return replies
+
+async def _get_all_replies_async(client: Client, actor_did: str, days: int, window_days: int, concurrency: int) -> list:
+    until = datetime.now(timezone.utc)
+    start = until - timedelta(days=days)
+    windows = []
+    while until > start:
+        since = max(start, until - timedelta(days=window_days))
+        windows.append((since, until))
+        until = since
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *[_fetch_reply_window(client, actor_did, since, until, semaphore) for since, until in windows]
+    )
+
+    # Adjacent windows share a boundary timestamp, so keep each post only once
+    replies_by_uri = {}
+    for window_replies in results:
+        for post in window_replies:
+            replies_by_uri.setdefault(post.uri, post)
+    return list(replies_by_uri.values())
 
-def analyze_reply_timing(replies: list) -> pd.DataFrame:
+def get_all_replies(client: Client, actor_did: str, days: int = 30, window_days: int = 7, concurrency: int = 4) -> list:
+    """
+    Fetches the replies made by a specific actor (user DID) over the last `days` days.
+    The search endpoint caps how deep one query can page, so the period is split into
+    `window_days`-long windows that are fetched concurrently (at most `concurrency` at a time).
+    """
+    if days < 0 or window_days <= 0:
+        raise ValueError(f"days must be >= 0 and window_days > 0 (got days={days}, window_days={window_days})")
+    return asyncio.run(_get_all_replies_async(client, actor_did, days, window_days, concurrency))
+
+def describe_diffs(time_diffs_seconds: np.ndarray) -> dict:
+    """
+    Computes summary statistics (like DataFrame.describe) for reply time differences, in numpy.
+    """
+    q25, q50, q75 = np.percentile(time_diffs_seconds, [25, 50, 75])
+    return {
+        'count': time_diffs_seconds.size,
+        'mean': time_diffs_seconds.mean(),
+        'std': time_diffs_seconds.std(ddof=1) if time_diffs_seconds.size > 1 else np.nan,
+        'min': time_diffs_seconds.min(),
+        '25%': q25,
+        '50%': q50,
+        '75%': q75,
+        'max': time_diffs_seconds.max(),
+    }
+
+def analyze_reply_timing(replies: list) -> np.ndarray:
     """
     Analyzes the timing patterns between a user's replies.
+    Returns the time differences between consecutive replies in seconds (empty if there are fewer than two).
     """
     if not replies:
-        return pd.DataFrame()
-
-    # Extract timestamps and sort them
-    timestamps = []
-    for post in replies:
-        try:
-            # Ensure the post is a valid record and has a createdAt field
-            if isinstance(post.record, models.AppBskyFeedPost.Record) and post.record.created_at:
-                timestamps.append(pd.to_datetime(post.record.created_at))
-        except Exception as e:
-            logging.warning(f"Could not parse timestamp for a post: {e}")
-            continue
+        return np.array([])
 
-    if not timestamps:
-        return pd.DataFrame()
+    # Extract raw timestamp strings and parse them in a single vectorized pass
+    raw_timestamps = [
+        post.record.created_at for post in replies
+        if isinstance(post.record, models.AppBskyFeedPost.Record) and post.record.created_at
+    ]
+    timestamps = pd.to_datetime(raw_timestamps, format='ISO8601', utc=True, errors='coerce')
+    timestamps = timestamps.dropna().sort_values()
 
-    timestamps.sort()
-
-    # Calculate time differences between consecutive replies
-    time_diffs = [timestamps[i] - timestamps[i-1] for i in range(1, len(timestamps))]
-
-    # Convert timedelta to seconds for easier analysis
-    time_diffs_seconds = [td.total_seconds() for td in time_diffs]
-
-    df = pd.DataFrame({'time_diff_seconds': time_diffs_seconds})
+    # Calculate time differences between consecutive replies, in seconds
+    time_diffs_seconds = np.diff(timestamps.values) / np.timedelta64(1, 's')
+    if time_diffs_seconds.size == 0:
+        return time_diffs_seconds
 
     # Basic statistics
-    logging.info(f"\nReply Timing Analysis (seconds):\n{df.describe()}")
+    stats = describe_diffs(time_diffs_seconds)
+    stats_text = "\n".join(f"{name:<6}{value:>14.2f}" for name, value in stats.items())
+    logging.info(f"\nReply Timing Analysis (seconds):\n{stats_text}")
 
-    return df
+    return time_diffs_seconds
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze Bluesky user reply timing patterns.")
@@ -86,8 +135,24 @@ def main():
         required=True,
         help="The Bluesky handle (e.g., 'user.bsky.social') of the user to analyze."
     )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=30,
+        help="Number of past days of replies to fetch. Default: 30"
+    )
+    parser.add_argument(
+        "--window_days",
+        type=int,
+        default=7,
+        help="Length in days of each search window fetched concurrently. Default: 7"
+    )
     args = parser.parse_args()
 
+    if args.days < 0 or args.window_days <= 0:
+        logging.error("--days must be 0 or more and --window_days must be at least 1.")
+        return
+
     if not BSKY_USERNAME or not BSKY_PASSWORD:
         logging.error("Bluesky username or password not found in .env file.")
         return
@@ -109,13 +174,13 @@ def main():
         logging.error(f"Could not resolve DID for handle {args.handle}: {e}")
         return
 
-    logging.info(f"Fetching all replies for {args.handle}...")
-    replies = get_all_replies(client, actor_did)
+    logging.info(f"Fetching replies from the last {args.days} days for {args.handle}...")
+    replies = get_all_replies(client, actor_did, args.days, args.window_days)
     logging.info(f"Found {len(replies)} replies for {args.handle}.")
 
     if replies:
-        df_timing = analyze_reply_timing(replies)
-        if not df_timing.empty:
+        time_diffs = analyze_reply_timing(replies)
+        if time_diffs.size:
             logging.info("Reply timing analysis complete.")
             # You can add more visualization or saving logic here if needed
         else:
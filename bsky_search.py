@@ -1,8 +1,12 @@
 import os
-import requests
+import orjson
+import asyncio
+import aiohttp
+import urllib3
 from dotenv import load_dotenv
 from tqdm import tqdm
 import time
+import threading
 import logging
 import argparse
 
@@ -16,45 +20,119 @@ load_dotenv()
 BSKY_USERNAME = os.getenv("BSKY_USERNAME")
 BSKY_PASSWORD = os.getenv("BSKY_PASSWORD")
 BSKY_PDS_URL = os.getenv("BSKY_PDS_URL", "https://bsky.social")
+# Where the access JWT is cached between runs so restarts don't log in again
+BSKY_SESSION_FILE = os.getenv("BSKY_SESSION_FILE", ".bsky_session.json")
 
 class BlueskySearchClient:
-    def __init__(self, pds_url: str, username: str, password: str):
+    def __init__(self, pds_url: str, username: str, password: str, session_file: str = BSKY_SESSION_FILE):
         self.pds_url = pds_url
         self.session_url = f"{self.pds_url}/xrpc/com.atproto.server.createSession"
         self.search_url = f"{self.pds_url}/xrpc/app.bsky.feed.searchPosts"
         self.username = username
         self.password = password
+        self.session_file = session_file
         self.jwt = None
+        self._auth_lock = threading.Lock() # Serializes re-logins triggered by concurrent searches
         self.rate_limit_reset_time = 0
         self.rate_limit_remaining = 0
+        # One pool for the lifetime of the client so every page reuses the same keep-alive connection
+        self.http = urllib3.PoolManager(maxsize=4, retries=urllib3.Retry(total=3, backoff_factor=0.3))
         self._authenticate()
 
-    def _authenticate(self):
+    def _raise_for_status(self, response):
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"HTTP {response.status} error: {response.data.decode('utf-8', 'replace')}")
+
+    def _load_cached_jwt(self):
+        try:
+            with open(self.session_file, 'rb') as f:
+                session = orjson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(session, dict):
+            return None
+        if session.get("pds_url") == self.pds_url and session.get("username") == self.username:
+            return session.get("accessJwt")
+        return None
+
+    def _save_cached_jwt(self):
+        try:
+            # Create the file owner-only, and tighten it in case it already existed
+            fd = os.open(self.session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.chmod(self.session_file, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps({"pds_url": self.pds_url, "username": self.username, "accessJwt": self.jwt}))
+        except OSError as e:
+            logging.warning(f"Could not cache session to {self.session_file}: {e}")
+
+    def _token_rejected(self, status: int, body: bytes) -> bool:
+        # The PDS answers 401 for an invalid token and 400 with an ExpiredToken error for an expired one
+        return status == 401 or (status == 400 and b"ExpiredToken" in body)
+
+    def _refresh_rejected_token(self, status: int, body: bytes, stale_jwt: str) -> bool:
+        """
+        Returns True if a request sent with stale_jwt should be retried because the PDS rejected its token.
+        Logs in again unless another request already replaced the token, so concurrent searches that
+        all hit the same expired token trigger a single login.
+        """
+        if not self._token_rejected(status, body):
+            return False
+        with self._auth_lock:
+            if self.jwt == stale_jwt:
+                self._authenticate(use_cached=False)
+        return True
+
+    def _auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.jwt}"}
+
+    def _authenticate(self, use_cached: bool = True):
+        """
+        Sets self.jwt, reusing the token cached in session_file when allowed. An expired cached
+        token is caught later as a 401, which calls this again with use_cached=False.
+        """
+        if use_cached:
+            self.jwt = self._load_cached_jwt()
+            if self.jwt:
+                logging.info(f"Reusing cached Bluesky session from {self.session_file}.")
+                return
         try:
-            response = requests.post(self.session_url, json={
-                "identifier": self.username,
-                "password": self.password
-            })
-            response.raise_for_status()
-            self.jwt = response.json()["accessJwt"]
+            response = self.http.request(
+                "POST",
+                self.session_url,
+                headers={"Content-Type": "application/json"},
+                body=orjson.dumps({
+                    "identifier": self.username,
+                    "password": self.password
+                })
+            )
+            self._raise_for_status(response)
+            self.jwt = orjson.loads(response.data)["accessJwt"]
             logging.info("Successfully authenticated with Bluesky PDS.")
-        except requests.exceptions.RequestException as e:
+            self._save_cached_jwt()
+        except urllib3.exceptions.HTTPError as e:
             logging.error(f"Authentication failed: {e}")
             raise
 
-    def _check_rate_limit(self, response_headers):
+    def _rate_limit_sleep_time(self, response_headers) -> float:
+        """
+        Updates the rate limit state from response headers and returns how long to wait (0 if not limited).
+        """
         self.rate_limit_remaining = int(response_headers.get("RateLimit-Remaining", 1))
         self.rate_limit_reset_time = int(response_headers.get("RateLimit-Reset", time.time()))
         if self.rate_limit_remaining == 0:
             sleep_time = max(0, self.rate_limit_reset_time - time.time()) + 1 # Add 1 second buffer
             logging.warning(f"Rate limit hit. Sleeping for {sleep_time:.2f} seconds until reset.")
+            return sleep_time
+        return 0
+
+    def _check_rate_limit(self, response_headers):
+        sleep_time = self._rate_limit_sleep_time(response_headers)
+        if sleep_time:
             time.sleep(sleep_time)
-            self._authenticate() # Re-authenticate after rate limit to get fresh token if needed
 
     def search_posts(self, query: str, limit: int = 100, max_pages: int = 5) -> list:
         all_posts = []
         cursor = None
-        headers = {"Authorization": f"Bearer {self.jwt}"}
 
         for page in tqdm(range(max_pages), desc=f"Searching for '{query}'"):
             params = {"q": query, "limit": limit}
@@ -62,10 +140,14 @@ class BlueskySearchClient:
                 params["cursor"] = cursor
 
             try:
-                response = requests.get(self.search_url, headers=headers, params=params)
+                jwt = self.jwt
+                response = self.http.request("GET", self.search_url, headers=self._auth_headers(), fields=params)
+                if self._refresh_rejected_token(response.status, response.data, jwt):
+                    # Retry this page once with the new token
+                    response = self.http.request("GET", self.search_url, headers=self._auth_headers(), fields=params)
                 self._check_rate_limit(response.headers)
-                response.raise_for_status()
-                data = response.json()
+                self._raise_for_status(response)
+                data = orjson.loads(response.data)
                 posts = data.get("posts", [])
                 if not posts:
                     break
@@ -74,7 +156,7 @@ class BlueskySearchClient:
                 if not cursor:
                     break
                 time.sleep(1) # Small delay between pages
-            except requests.exceptions.RequestException as e:
+            except urllib3.exceptions.HTTPError as e:
                 logging.error(f"Error during search for '{query}': {e}")
                 break
             except Exception as e:
@@ -82,13 +164,72 @@ class BlueskySearchClient:
                 break
         return all_posts
 
+    async def search_posts_async(self, session: aiohttp.ClientSession, query: str, limit: int = 100, max_pages: int = 5) -> list:
+        """
+        Async variant of search_posts. Pages of a single query are still fetched in cursor order,
+        but several queries can share one session and run concurrently (see search_many_async).
+        """
+        all_posts = []
+        cursor = None
+
+        for page in range(max_pages):
+            params = {"q": query, "limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+
+            try:
+                for attempt in range(2):
+                    jwt = self.jwt
+                    async with session.get(self.search_url, headers=self._auth_headers(), params=params) as response:
+                        if attempt == 0 and response.status in (400, 401):
+                            body = await response.read()
+                            # The login is a blocking urllib3 POST, so keep it off the event loop
+                            if await asyncio.to_thread(self._refresh_rejected_token, response.status, body, jwt):
+                                continue
+                        sleep_time = self._rate_limit_sleep_time(response.headers)
+                        response.raise_for_status()
+                        data = orjson.loads(await response.read())
+                    break
+                if sleep_time:
+                    await asyncio.sleep(sleep_time)
+                posts = data.get("posts", [])
+                if not posts:
+                    break
+                all_posts.extend(posts)
+                cursor = data.get("cursor")
+                if not cursor:
+                    break
+            except aiohttp.ClientError as e:
+                logging.error(f"Error during search for '{query}': {e}")
+                break
+            except Exception as e:
+                logging.error(f"An unexpected error occurred: {e}")
+                break
+        return all_posts
+
+    async def search_many_async(self, queries: list, limit: int = 100, max_pages: int = 5, concurrency: int = 8) -> dict:
+        """
+        Runs several searches concurrently, bounded by a semaphore. Returns {query: [posts, ...]}.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded_search(session, query):
+            async with semaphore:
+                return await self.search_posts_async(session, query, limit, max_pages)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            results = await asyncio.gather(*[bounded_search(session, query) for query in queries])
+        return dict(zip(queries, results))
+
 def main():
     parser = argparse.ArgumentParser(description="Search Bluesky posts for specific phrases.")
     parser.add_argument(
         "--query",
         type=str,
+        nargs='+',
         required=True,
-        help="The exact phrase to search for in Bluesky posts."
+        help="The exact phrase to search for in Bluesky posts. Pass several phrases to search them concurrently."
     )
     parser.add_argument(
         "--limit",
@@ -116,12 +257,21 @@ def main():
 
     try:
         client = BlueskySearchClient(BSKY_PDS_URL, BSKY_USERNAME, BSKY_PASSWORD)
-        logging.info(f"Starting search for query: '{args.query}'")
-        posts = client.search_posts(args.query, args.limit, args.max_pages)
-        logging.info(f"Found {len(posts)} posts matching '{args.query}'.")
+        if len(args.query) == 1:
+            query = args.query[0]
+            logging.info(f"Starting search for query: '{query}'")
+            results = client.search_posts(query, args.limit, args.max_pages)
+            logging.info(f"Found {len(results)} posts matching '{query}'.")
+        else:
+            # Several phrases: run the searches concurrently and save {query: [posts, ...]}
+            logging.info(f"Starting concurrent search for {len(args.query)} queries: {args.query}")
+            results = asyncio.run(client.search_many_async(args.query, args.limit, args.max_pages))
+            for query, posts in results.items():
+                logging.info(f"Found {len(posts)} posts matching '{query}'.")
 
-        with open(args.output_file, 'w', encoding='utf-8') as f:
-            json.dump(posts, f, indent=2, ensure_ascii=False)
+        # orjson always emits UTF-8, matching the old ensure_ascii=False output
+        with open(args.output_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
         logging.info(f"Search results saved to {args.output_file}")
 
     except Exception as e:
@@ -11,7 +11,11 @@ def track_group_reposts(input_csv: str, output_csv: str):
     The input CSV is expected to have a 'handle' column.
     """
     try:
-        df = pd.read_csv(input_csv)
+        try:
+            # Arrow's multithreaded C++ CSV reader; fall back to the C parser if pyarrow is missing
+            df = pd.read_csv(input_csv, engine='pyarrow', dtype={'handle': 'string'})
+        except ImportError:
+            df = pd.read_csv(input_csv, dtype={'handle': 'string'})
         if 'handle' not in df.columns:
             logging.error(f"Error: Input CSV '{input_csv}' must contain a 'handle' column.")
             return
@@ -13,17 +13,27 @@ def visualize_spammer_activity(input_csv: str, output_image: str):
     The input CSV is expected to have 'timestamp' and 'handle' columns.
     """
     try:
-        df = pd.read_csv(input_csv)
+        try:
+            # Arrow's C++ CSV reader also infers ISO-8601 timestamps, so the to_datetime below is cheap
+            df = pd.read_csv(input_csv, engine='pyarrow', dtype={'handle': 'string'})
+        except ImportError:
+            df = pd.read_csv(input_csv, dtype={'handle': 'string'})
         if 'timestamp' not in df.columns or 'handle' not in df.columns:
             logging.error(f"Error: Input CSV '{input_csv}' must contain 'timestamp' and 'handle' columns.")
             return
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', utc=True, errors='coerce')
         df = df.sort_values('timestamp')
 
         # Aggregate activity by handle and time (e.g., daily)
-        df['date'] = df['timestamp'].dt.date
-        activity_counts = df.groupby(['date', 'handle']).size().reset_index(name='post_count')
+        # Categorical handles group on integer codes rather than hashing strings
+        df['handle'] = df['handle'].astype('category')
+        activity_counts = (
+            df.groupby([df['timestamp'].dt.floor('D').rename('date'), 'handle'], sort=False, observed=True)
+            .size()
+            .rename('post_count')
+            .reset_index()
+        )
 
         plt.figure(figsize=(15, 8))
         sns.lineplot(data=activity_counts, x='date', y='post_count', hue='handle', marker='o')
@@ -1,12 +1,14 @@
 import os
 import json
 import csv
+import time
+from typing import Optional
 from datetime import datetime
 from dotenv import load_dotenv
 import logging
 import argparse
 
-from atproto import CAR, AtUri, Client, models, parse_subscribe_labels_message
+from atproto import CAR, Client, models, parse_subscribe_labels_message
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,28 +20,72 @@ load_dotenv()
 BSKY_USERNAME = os.getenv("BSKY_USERNAME")
 BSKY_PASSWORD = os.getenv("BSKY_PASSWORD")
 
-def write_spam_label(handle: str, timestamp: str, output_csv: str):
+# Flush the output CSV to disk after this many rows
+FLUSH_EVERY_ROWS = 100
+# Maximum number of actors app.bsky.actor.getProfiles accepts per call
+GET_PROFILES_BATCH_SIZE = 25
+# How long to wait before retrying a DID whose profile lookup failed (often suspended or deleted spam accounts)
+FAILED_LOOKUP_RETRY_SECONDS = 3600
+
+def write_spam_label(writer, handle: str, timestamp: str):
+    """
+    Writes a detected spam label to an already-open CSV writer.
+    """
+    writer.writerow([handle, timestamp])
+
+def label_subject_host(uri: str) -> str:
+    """
+    Returns the DID or handle a label applies to. Record labels carry an at:// URI whose host
+    is the account; account labels carry the bare DID. Slicing avoids building an AtUri per label.
+    """
+    if uri.startswith('at://'):
+        return uri[5:].split('/', 1)[0]
+    return uri
+
+def cached_handle(did: str, handle_cache: dict) -> Optional[str]:
     """
-    Writes detected spam labels to a CSV file.
+    Looks up a DID in handle_cache, which maps each DID to its handle, or to a retry deadline
+    (time.monotonic() seconds) after a failed lookup. Returns the handle, the DID itself while a
+    failed lookup is still fresh, or None if the DID should be fetched.
     """
-    file_exists = os.path.isfile(output_csv)
-    with open(output_csv, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(['handle', 'timestamp'])
-        writer.writerow([handle, timestamp])
-
-def resolve_did_to_handle(client: Client, did: str) -> str:
+    cached = handle_cache.get(did)
+    if isinstance(cached, str):
+        return cached
+    if cached is not None and time.monotonic() < cached:
+        return did
+    return None
+
+def resolve_did_to_handle(client: Client, did: str, handle_cache: dict) -> str:
     """
-    Resolves a DID to a Bluesky handle.
+    Resolves a DID to a Bluesky handle, using handle_cache to skip DIDs that were already looked up.
     """
+    handle = cached_handle(did, handle_cache)
+    if handle is not None:
+        return handle
     try:
         profile = client.app.bsky.actor.get_profile(actor=did)
+        handle_cache[did] = profile.handle
         return profile.handle
     except Exception as e:
         logging.warning(f"Could not resolve DID {did} to handle: {e}")
+        handle_cache[did] = time.monotonic() + FAILED_LOOKUP_RETRY_SECONDS
         return did # Return DID if handle resolution fails
 
+def prefetch_handles(client: Client, dids, handle_cache: dict):
+    """
+    Resolves uncached DIDs (skipping recently failed ones) in batches of up to 25 with getProfiles and stores the results in handle_cache.
+    DIDs missing from the response are left to resolve_did_to_handle's per-DID lookup.
+    """
+    unresolved = [did for did in dict.fromkeys(dids) if cached_handle(did, handle_cache) is None]
+    for i in range(0, len(unresolved), GET_PROFILES_BATCH_SIZE):
+        batch = unresolved[i:i + GET_PROFILES_BATCH_SIZE]
+        try:
+            response = client.app.bsky.actor.get_profiles(params={'actors': batch})
+            for profile in response.profiles:
+                handle_cache[profile.did] = profile.handle
+        except Exception as e:
+            logging.warning(f"Could not batch resolve {len(batch)} DIDs to handles: {e}")
+
 def subscribe_to_labels(output_csv: str, duration_seconds: int):
     """
     Subscribes to Bluesky label updates and logs spam labels.
@@ -68,6 +114,14 @@ def subscribe_to_labels(output_csv: str, duration_seconds: int):
     # The original gist might have used a lower-level approach or an older SDK version.
     # We'll use the current recommended way.
 
+    # Open the output once for the whole subscription instead of once per label
+    output_file = open(output_csv, 'a', newline='', encoding='utf-8', buffering=1 << 16)
+    csv_writer = csv.writer(output_file)
+    if output_file.tell() == 0:
+        csv_writer.writerow(['handle', 'timestamp'])
+    rows_written = 0
+    handle_cache = {} # {did: handle or retry deadline}, spam campaigns keep hitting the same accounts
+
     try:
         for message in client.subscribe_labels():
             if (datetime.now() - start_time).total_seconds() > duration_seconds:
@@ -77,22 +131,36 @@ def subscribe_to_labels(output_csv: str, duration_seconds: int):
             parsed_message = parse_subscribe_labels_message(message)
 
             if isinstance(parsed_message, models.ComAtprotoLabelSubscribeLabels.Labels):
-                for label in parsed_message.labels:
-                    if label.val == 'spam':
-                        uri = AtUri.from_str(label.uri)
-                        handle_or_did = uri.host
-                        
-                        # Resolve DID to handle if client is available
-                        if client and handle_or_did.startswith('did:'):
-                            resolved_handle = resolve_did_to_handle(client, handle_or_did)
-                            logging.info(f"Detected spam label for DID: {handle_or_did}, resolved to handle: {resolved_handle}")
-                            write_spam_label(resolved_handle, label.cts, output_csv)
-                        else:
-                            logging.info(f"Detected spam label for: {handle_or_did}")
-                            write_spam_label(handle_or_did, label.cts, output_csv)
+                spam_labels = [
+                    (label_subject_host(label.uri), label)
+                    for label in parsed_message.labels if label.val == 'spam'
+                ]
+                if client:
+                    # Resolve every DID in this message with as few getProfiles calls as possible
+                    prefetch_handles(
+                        client,
+                        [handle_or_did for handle_or_did, _ in spam_labels if handle_or_did.startswith('did:')],
+                        handle_cache
+                    )
+
+                for handle_or_did, label in spam_labels:
+                    # Resolve DID to handle if client is available
+                    if client and handle_or_did.startswith('did:'):
+                        resolved_handle = resolve_did_to_handle(client, handle_or_did, handle_cache)
+                        logging.info(f"Detected spam label for DID: {handle_or_did}, resolved to handle: {resolved_handle}")
+                        write_spam_label(csv_writer, resolved_handle, label.cts)
+                    else:
+                        logging.info(f"Detected spam label for: {handle_or_did}")
+                        write_spam_label(csv_writer, handle_or_did, label.cts)
+
+                    rows_written += 1
+                    if rows_written % FLUSH_EVERY_ROWS == 0:
+                        output_file.flush()
 
     except Exception as e:
         logging.error(f"Error subscribing to labels: {e}")
+    finally:
+        output_file.close()
 
 def main():
     parser = argparse.ArgumentParser(description="Subscribe to Bluesky label firehose to detect spam.")
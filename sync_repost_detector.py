@@ -2,13 +2,15 @@ import os
 import json
 import time
 import csv
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from typing import Optional
+from datetime import datetime
 from dotenv import load_dotenv
 import logging
 import argparse
 
-from atproto import Client, models, parse_subscribe_repos_message
+import ciso8601
+from atproto import CAR, Client, models, parse_subscribe_repos_message
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,12 +22,74 @@ load_dotenv()
 BSKY_USERNAME = os.getenv("BSKY_USERNAME")
 BSKY_PASSWORD = os.getenv("BSKY_PASSWORD")
 
+# Maximum number of actors app.bsky.actor.getProfiles accepts per call
+GET_PROFILES_BATCH_SIZE = 25
+# How long to wait before retrying a DID whose profile lookup failed (suspended or deleted accounts fail every time)
+FAILED_LOOKUP_RETRY_SECONDS = 3600
+# Firehose op paths look like "<collection>/<rkey>"
+REPOST_PATH_PREFIX = f"{models.ids.AppBskyFeedRepost}/"
+
+class PostReposts:
+    """
+    The reposts of one post that are still inside the time window, in arrival order.
+    Firehose times come from each PDS's own clock, so they are not in order; the earliest and
+    latest repost time are tracked with monotonic deques so both stay O(1) amortized per repost.
+    """
+    __slots__ = ('events', 'reposter_counts', '_min', '_max', '_pushed', '_popped')
+
+    def __init__(self):
+        self.events = deque() # (reposter_did, timestamp_ns), oldest arrival first
+        self.reposter_counts = Counter() # {reposter_did: reposts}
+        self._min = deque() # (timestamp_ns, seq) with increasing timestamps; front is the minimum
+        self._max = deque() # (timestamp_ns, seq) with decreasing timestamps; front is the maximum
+        self._pushed = 0 # seq of the next appended event
+        self._popped = 0 # seq of the current oldest event
+
+    def append(self, reposter_did: str, timestamp_ns: int):
+        self.events.append((reposter_did, timestamp_ns))
+        self.reposter_counts[reposter_did] += 1
+        seq = self._pushed
+        self._pushed += 1
+        while self._min and self._min[-1][0] >= timestamp_ns:
+            self._min.pop()
+        self._min.append((timestamp_ns, seq))
+        while self._max and self._max[-1][0] <= timestamp_ns:
+            self._max.pop()
+        self._max.append((timestamp_ns, seq))
+
+    def popleft(self) -> tuple:
+        reposter_did, timestamp_ns = self.events.popleft()
+        seq = self._popped
+        self._popped += 1
+        if self._min[0][1] == seq:
+            self._min.popleft()
+        if self._max[0][1] == seq:
+            self._max.popleft()
+        self.reposter_counts[reposter_did] -= 1
+        if not self.reposter_counts[reposter_did]:
+            del self.reposter_counts[reposter_did]
+        return reposter_did, timestamp_ns
+
+    def span_ns(self) -> int:
+        # Latest minus earliest repost time currently cached
+        return self._max[0][0] - self._min[0][0]
+
 class RepostMonitor:
-    def __init__(self, min_group_size: int = 3, min_shared_posts: int = 4, time_window_minutes: int = 20):
+    def __init__(self, min_group_size: int = 3, min_shared_posts: int = 4, time_window_minutes: int = 20,
+                 max_cached_posts: int = 200_000):
+        if max_cached_posts < 1:
+            raise ValueError(f"max_cached_posts must be at least 1 (got {max_cached_posts})")
         self.min_group_size = min_group_size
         self.min_shared_posts = min_shared_posts
-        self.time_window = timedelta(minutes=time_window_minutes)
-        self.repost_cache = defaultdict(lambda: defaultdict(list)) # {post_uri: {reposter_did: [timestamp, ...]}}
+        # Times are kept as int unix nanoseconds: cheap to store and compare on the firehose hot path
+        self.time_window_ns = time_window_minutes * 60 * 1_000_000_000
+        self.max_cached_posts = max_cached_posts
+        # {post_uri: PostReposts}, least recently reposted post first
+        self.events_by_post = OrderedDict()
+        self._events = deque() # (arrival_clock_ns, post_uri, PostReposts) in arrival order, for time-based eviction
+        self._stale_events = 0 # Entries in _events whose post was dropped by the size cap
+        self._clock_ns = 0 # Eviction clock: high-water mark of repost times, clamped to wall time
+        self.handle_cache = {} # {did: handle, or time.monotonic() retry deadline after a failed lookup}
         self.client = Client()
         self.logged_in = False
 
@@ -39,65 +103,111 @@ class RepostMonitor:
         else:
             logging.warning("Bluesky username or password not found. Will proceed without handle resolution.")
 
+    def _cached_handle(self, did: str) -> Optional[str]:
+        # The cached handle, the DID itself while a failed lookup is still fresh, or None to fetch it
+        cached = self.handle_cache.get(did)
+        if isinstance(cached, str):
+            return cached
+        if cached is not None and time.monotonic() < cached:
+            return did
+        return None
+
     def _resolve_did_to_handle(self, did: str) -> str:
+        handle = self._cached_handle(did)
+        if handle is not None:
+            return handle
         if self.logged_in:
             try:
                 profile = self.client.app.bsky.actor.get_profile(actor=did)
+                self.handle_cache[did] = profile.handle
                 return profile.handle
             except Exception as e:
                 logging.warning(f"Could not resolve DID {did} to handle: {e}")
+                self.handle_cache[did] = time.monotonic() + FAILED_LOOKUP_RETRY_SECONDS
         return did # Return DID if handle resolution fails or not logged in
 
-    def _clean_cache(self):
-        # Remove old entries from cache
-        cutoff_time = datetime.now() - self.time_window
-        posts_to_remove = []
-        for post_uri, reposter_data in self.repost_cache.items():
-            repost_data_to_keep = {}
-            for reposter_did, timestamps in reposter_data.items():
-                # Keep only timestamps within the window
-                filtered_timestamps = [ts for ts in timestamps if ts > cutoff_time]
-                if filtered_timestamps:
-                    repost_data_to_keep[reposter_did] = filtered_timestamps
-            
-            if not repost_data_to_keep:
-                posts_to_remove.append(post_uri)
-            else:
-                self.repost_cache[post_uri] = reposter_data_to_keep
-        
-        for post_uri in posts_to_remove:
-            del self.repost_cache[post_uri]
-
-    def process_repost(self, repo_did: str, record: models.AppBskyFeedRepost.Record, timestamp: str):
-        post_uri = record.subject.uri.uri
-        repost_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-
-        self.repost_cache[post_uri][repo_did].append(repost_time)
-        self.repost_cache[post_uri][repo_did].sort() # Keep timestamps sorted
-
-        self._clean_cache()
+    def _prefetch_handles(self, dids: list):
+        # Resolve uncached DIDs in batches via getProfiles; any DID missing from the
+        # response falls through to the per-DID lookup in _resolve_did_to_handle
+        if not self.logged_in:
+            return
+        unresolved = [did for did in dict.fromkeys(dids) if self._cached_handle(did) is None]
+        for i in range(0, len(unresolved), GET_PROFILES_BATCH_SIZE):
+            batch = unresolved[i:i + GET_PROFILES_BATCH_SIZE]
+            try:
+                response = self.client.app.bsky.actor.get_profiles(params={'actors': batch})
+                for profile in response.profiles:
+                    self.handle_cache[profile.did] = profile.handle
+            except Exception as e:
+                logging.warning(f"Could not batch resolve {len(batch)} DIDs to handles: {e}")
+
+    def _clean_cache(self, now_ns: int):
+        # Evict reposts that arrived more than one time window ago. Events are queued in arrival
+        # order with a monotonic clock, so only the expired head of the deque is touched
+        # instead of the whole cache.
+        # Each post's reposts are popped in the same arrival order, so an expired event is
+        # always the oldest one of its post and comes off the left of PostReposts in O(1).
+        cutoff_ns = now_ns - self.time_window_ns
+        while self._events and self._events[0][0] <= cutoff_ns:
+            _, post_uri, post = self._events.popleft()
+            if self.events_by_post.get(post_uri) is not post:
+                self._stale_events -= 1
+                continue # Post was dropped by the size cap (and maybe re-added since)
+            post.popleft()
+            if not post.events:
+                del self.events_by_post[post_uri]
+
+    def _cache_post(self, post_uri: str) -> PostReposts:
+        # Return the PostReposts for post_uri, marking it most recently used.
+        # When the cache grows past max_cached_posts, the least recently reposted post is dropped.
+        # This caps the number of tracked posts; memory still grows with the reposts those posts
+        # receive within the time window.
+        post = self.events_by_post.get(post_uri)
+        if post is not None:
+            self.events_by_post.move_to_end(post_uri)
+            return post
+
+        post = self.events_by_post[post_uri] = PostReposts()
+        if len(self.events_by_post) > self.max_cached_posts:
+            _, evicted = self.events_by_post.popitem(last=False)
+            self._stale_events += len(evicted.events)
+            # The dropped post's entries would otherwise sit in _events until they expire.
+            # Rebuild once they make up half of it, so the cost is amortized O(1) per entry.
+            if self._stale_events > len(self._events) // 2:
+                self._events = deque(
+                    entry for entry in self._events if self.events_by_post.get(entry[1]) is entry[2]
+                )
+                self._stale_events = 0
+        return post
+
+    def process_repost(self, repo_did: str, post_uri: str, timestamp: str):
+        # Firehose times have microsecond precision, so rounding recovers the exact microsecond count
+        repost_time_ns = round(ciso8601.parse_datetime(timestamp).timestamp() * 1_000_000) * 1_000
+
+        post = self._cache_post(post_uri)
+        post.append(repo_did, repost_time_ns)
+        # Repost times come from each PDS's clock. Advance the eviction clock with them, but never
+        # backwards and never past wall time, so one PDS with a fast clock can't expire everyone else's reposts.
+        self._clock_ns = max(self._clock_ns, min(repost_time_ns, time.time_ns()))
+        self._events.append((self._clock_ns, post_uri, post))
+
+        self._clean_cache(self._clock_ns)
 
         # Check for synchronized reposts
-        reposters = self.repost_cache[post_uri]
-        if len(reposters) >= self.min_group_size:
-            # Check if all reposts for this post_uri are within the time window
-            all_timestamps = []
-            for did, timestamps in reposters.items():
-                all_timestamps.extend(timestamps)
-            
-            if all_timestamps:
-                min_ts = min(all_timestamps)
-                max_ts = max(all_timestamps)
-                if (max_ts - min_ts) <= self.time_window:
-                    # This post has been reposted by a group within the time window
-                    # Now check if these group members have shared enough other posts
-                    
-                    # This part is complex and would require fetching more data for each group member
-                    # to see their shared repost history. For now, we'll just log the group.
-                    group_dids = list(reposters.keys())
-                    group_handles = [self._resolve_did_to_handle(did) for did in group_dids]
-                    logging.info(f"Detected potential synchronized repost group for post {post_uri}: {group_handles}")
-                    # In a real scenario, you'd save this to a file or further analyze
+        if post_uri not in self.events_by_post or len(post.reposter_counts) < self.min_group_size:
+            return
+        # Check if all reposts for this post_uri are within the time window
+        if post.span_ns() <= self.time_window_ns:
+            # This post has been reposted by a group within the time window
+            # Now check if these group members have shared enough other posts
+
+            # This part is complex and would require fetching more data for each group member
+            # to see their shared repost history. For now, we'll just log the group.
+            group_dids = list(post.reposter_counts)
+            self._prefetch_handles(group_dids)
+            group_handles = [self._resolve_did_to_handle(did) for did in group_dids]
+            logging.info(f"Detected potential synchronized repost group for post {post_uri}: {group_handles}")
+            # In a real scenario, you'd save this to a file or further analyze
 
     def listen_for_reposts(self, duration_seconds: int, output_csv: str):
         logging.info(f"Monitoring Bluesky firehose for synchronized reposts for {duration_seconds} seconds...")
@@ -119,33 +229,29 @@ class RepostMonitor:
                 parsed_message = parse_subscribe_repos_message(message)
 
                 if isinstance(parsed_message, models.ComAtprotoSyncSubscribeRepos.Commit):
+                    blocks = None # {cid: record dict}, decoded at most once per commit
                     for op in parsed_message.ops:
-                        uri = AtUri.from_str(f"at://{parsed_message.repo}/{op.path}")
-                        
-                        if op.action == 'create' and uri.collection == models.ids.AppBskyFeedRepost:
-                            # This is a new repost
-                            try:
-                                # Fetch the actual record to get the subject URI and timestamp
-                                # This might be inefficient for a firehose, but necessary to get full repost info
-                                # A more optimized approach would parse the record directly from the commit
-                                # For simplicity, we'll assume the record is directly available or can be fetched.
-                                # In atproto 0.10.0+, op.cid and op.record are available for created records.
-                                
-                                # Attempt to get the record from the message (if available)
-                                record_bytes = None
-                                for rec in parsed_message.blocks.values():
-                                    if str(rec.cid) == str(op.cid):
-                                        record_bytes = rec.value
-                                        break
-                                
-                                if record_bytes:
-                                    repost_record = models.AppBskyFeedRepost.Record.model_validate(record_bytes)
-                                    self.process_repost(parsed_message.repo, repost_record, parsed_message.time)
-                                else:
-                                    logging.warning(f"Could not find record for repost {uri}")
-
-                            except Exception as e:
-                                logging.error(f"Error processing repost record: {e}")
+                        # Cheap prefix test first: most ops are posts, likes and follows, skip them before any parsing
+                        if op.action != 'create' or not op.path.startswith(REPOST_PATH_PREFIX):
+                            continue
+
+                        # This is a new repost
+                        try:
+                            # The commit carries its records as a CAR file. CAR.from_bytes decodes every
+                            # DAG-CBOR block into a plain dict in one libipld call, so the record is a
+                            # dict lookup by CID and only the subject URI is read from it, without
+                            # building a pydantic model.
+                            if blocks is None:
+                                blocks = CAR.from_bytes(parsed_message.blocks).blocks
+                            record = blocks.get(op.cid)
+
+                            if record:
+                                self.process_repost(parsed_message.repo, record['subject']['uri'], parsed_message.time)
+                            else:
+                                logging.warning(f"Could not find record for repost at://{parsed_message.repo}/{op.path}")
+
+                        except Exception as e:
+                            logging.error(f"Error processing repost record: {e}")
 
         except Exception as e:
             logging.error(f"Error subscribing to repos: {e}")
@@ -185,9 +291,18 @@ def main():
         default=20,
         help="Time window in minutes within which reposts must occur to be considered synchronized. Default: 20"
     )
+    parser.add_argument(
+        "--max_cached_posts",
+        type=int,
+        default=200_000,
+        help="Maximum number of posts to track at once; the least recently reposted post is dropped beyond this. Default: 200000"
+    )
     args = parser.parse_args()
 
-    monitor = RepostMonitor(args.min_group_size, args.min_shared_posts, args.time_window_minutes)
+    if args.max_cached_posts < 1:
+        parser.error("--max_cached_posts must be at least 1")
+
+    monitor = RepostMonitor(args.min_group_size, args.min_shared_posts, args.time_window_minutes, args.max_cached_posts)
     monitor.listen_for_reposts(args.duration_seconds, args.output_csv)
 
 if __name__ == "__main__":